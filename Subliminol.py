@@ -2,6 +2,7 @@ import sys
 import os
 import time
 import functools
+import bisect
 import sublime
 import sublime_plugin
 import subprocess
@@ -171,6 +172,328 @@ def find_console(console_name, a_window=None):
 ################################################################################
 ################################################################################
 
+def line_offsets_of(text):
+	'''
+	Return the offset of every line start in text.
+	'''
+	offsets = [0]
+	index = text.find("\n")
+	while index != -1 and index+1 < len(text):
+		offsets.append(index+1)
+		index = text.find("\n", index+1)
+	return offsets
+
+class OutputSpan:
+	'''
+	A contiguous piece of one execution's output: [start, end) in the console.
+	line_offsets are line starts relative to start, or None when they need to
+	be rebuilt from the view.
+	'''
+	def __init__(self, entry, start, end, line_offsets=None):
+		self.entry = entry
+		self.start = start
+		self.end = end
+		self.line_offsets = line_offsets
+
+	def region(self):
+		return sublime.Region(self.start, self.end)
+
+
+class OutputIndexEntry:
+	'''
+	Records where a single execution wrote its output in the console.
+	Output from concurrent executions can interleave, so an entry may hold
+	several spans, kept in console order.
+	'''
+	def __init__(self, execution_id, command_string_data):
+		self.execution_id = execution_id
+		self.command_string_data = command_string_data[:]
+		self.spans = []
+
+	@property
+	def command_string(self):
+		return " | ".join([cs.strip() for cs in self.command_string_data])
+
+	@property
+	def region_id(self):
+		return "SBNL_OUT_[{0}]".format(self.execution_id)
+
+	def regions(self):
+		return [span.region() for span in self.spans]
+
+	def update_regions(self, view):
+		view.add_regions(self.region_id, self.regions(), "", "", sublime.HIDDEN)
+
+	def line_count(self, view):
+		count = 0
+		for span in self.spans:
+			if span.line_offsets is None:
+				span.line_offsets = line_offsets_of(view.substr(span.region()))
+			count += len(span.line_offsets)
+		return count
+
+
+class OutputIndex:
+	'''
+	Index of execution output written to a console, keyed by execution_id.
+	Maintained by SubliminolCallBase.to_console() so that jumping to, or
+	searching within, the output of a past command does not require scanning
+	the whole buffer. Removed by SubliminolOutputIndexListener when the
+	console is closed.
+
+	Span positions are tracked explicitly, so a write at the boundary of
+	another execution's output is never attributed to it. Each entry is
+	mirrored to a hidden region set on the console; when the view has been
+	modified by anything other than to_console() (detected via
+	change_count()), positions are re-read from those regions, which Sublime
+	has kept up to date across the edit.
+	'''
+	_indices = {}
+
+	@classmethod
+	def get(cls, console):
+		index = cls._indices.get(console.id(), None)
+		if index is None:
+			index = OutputIndex(console)
+			cls._indices[console.id()] = index
+		return index
+
+	@classmethod
+	def remove(cls, view_id):
+		cls._indices.pop(view_id, None)
+
+	def __init__(self, view):
+		self._entries = []
+		self._lookup = {}
+		# Every span of every entry, ordered by start
+		self._spans = []
+		self._change_count = view.change_count()
+
+	def _first_span_at(self, point):
+		'''
+		Return the index of the first span starting at or after point.
+		'''
+		lo = 0
+		hi = len(self._spans)
+		while lo < hi:
+			mid = (lo+hi)//2
+			if self._spans[mid].start < point:
+				lo = mid+1
+			else:
+				hi = mid
+		return lo
+
+	def sync(self, view):
+		'''
+		Re-read span positions from the console regions if the view was
+		edited since the last write, then drop entries with no output left.
+		'''
+		if view.change_count() == self._change_count:
+			return
+		self._spans = []
+		for entry in self._entries:
+			entry.spans = [
+				OutputSpan(entry, r.a, r.b) for r in view.get_regions(entry.region_id) if r.size() > 0
+			]
+			self._spans.extend(entry.spans)
+		self._spans.sort(key=lambda span: span.start)
+		dead = [e for e in self._entries if not len(e.spans)]
+		for entry in dead:
+			self._entries.remove(entry)
+			del self._lookup[entry.execution_id]
+			view.erase_regions(entry.region_id)
+		self._change_count = view.change_count()
+
+	def entries(self, view):
+		self.sync(view)
+		return self._entries[:]
+
+	def get_entry(self, execution_id):
+		return self._lookup.get(execution_id, None)
+
+	def record(self, view, execution_id, command_string_data, insertion_point, text, payload_start=0):
+		'''
+		Called by to_console() after text was inserted at insertion_point.
+		Only text[payload_start:] is attributed to execution_id; anything
+		before it is a separator. sync() must have been called before the
+		insert.
+		'''
+		length = len(text)
+		touched = set()
+
+		# Shift every span after the insertion. Only the span just before them
+		# can contain the insertion point.
+		index = self._first_span_at(insertion_point)
+		for span in self._spans[index:]:
+			span.start += length
+			span.end += length
+			touched.add(span.entry)
+		if index > 0:
+			previous = self._spans[index-1]
+			if previous.end > insertion_point:
+				previous.end += length
+				previous.line_offsets = None
+			# Re-assert its bounds in case Sublime grew the region at its end
+			touched.add(previous.entry)
+
+		entry = self._lookup.get(execution_id, None)
+		if entry is None:
+			entry = OutputIndexEntry(execution_id, command_string_data)
+			self._entries.append(entry)
+			self._lookup[execution_id] = entry
+
+		payload = text[payload_start:]
+		start = insertion_point + payload_start
+		end = start + len(payload)
+		if payload.strip("\n"):
+			new_offsets = line_offsets_of(payload)
+			# A chunk boundary only starts a line if the text before it ends with one.
+			for span in reversed(entry.spans):
+				if span.end == start and span.line_offsets is not None:
+					if view.substr(sublime.Region(span.end-1, span.end)) != "\n":
+						new_offsets = new_offsets[1:]
+					span.line_offsets += [span.end-span.start+o for o in new_offsets]
+					span.end = end
+					break
+				if span.start == end and span.line_offsets is not None:
+					offsets = span.line_offsets
+					if not payload.endswith("\n"):
+						offsets = offsets[1:]
+					span.line_offsets = new_offsets + [len(payload)+o for o in offsets]
+					span.start = start
+					break
+			else:
+				span = OutputSpan(entry, start, end, new_offsets)
+				self._spans.insert(self._first_span_at(start), span)
+				entry.spans.append(span)
+				entry.spans.sort(key=lambda span: span.start)
+			touched.add(entry)
+
+		for touched_entry in touched:
+			touched_entry.update_regions(view)
+		self._change_count = view.change_count()
+
+	def search(self, view, execution_id, pattern):
+		'''
+		Return a list of (line_number, Region) for each line of the output of
+		execution_id containing pattern. line_number is relative to the output.
+		'''
+		results = []
+		self.sync(view)
+		entry = self.get_entry(execution_id)
+		if entry is None or not pattern:
+			return results
+		base_line = 0
+		for span in entry.spans:
+			region = span.region()
+			text = view.substr(region)
+			# The text is read anyway, so rebuild offsets rather than trust the cache
+			line_offsets = line_offsets_of(text)
+			span.line_offsets = line_offsets
+			index = text.find(pattern)
+			while index != -1:
+				line_number = bisect.bisect_right(line_offsets, index)
+				line_start = line_offsets[line_number-1]
+				line_end = text.find("\n", index)
+				if line_end == -1:
+					line_end = len(text)
+				results.append((base_line+line_number, sublime.Region(region.a+line_start, region.a+line_end)))
+				index = text.find(pattern, line_end)
+			base_line += len(line_offsets)
+		return results
+
+
+class SubliminolOutputIndexListener(sublime_plugin.EventListener):
+	def on_close(self, view):
+		OutputIndex.remove(view.id())
+
+
+def show_output_regions(console_name, regions):
+	window, console = find_console(console_name)
+	if window is None or not len(regions):
+		return
+	window.focus_view(console)
+	selection = console.sel()
+	selection.clear()
+	for region in regions:
+		selection.add(region)
+	console.show(regions[0])
+
+def run_output_index_panel(window, callback):
+	'''
+	Open a panel listing every indexed execution in the console. callback is
+	passed the selected OutputIndexEntry.
+	'''
+	_window, console = find_console(CONSOLE_NAME)
+	if console is None:
+		sbnl_log("NO CONSOLE")
+		return
+	entries = OutputIndex.get(console).entries(console)
+	if not len(entries):
+		sbnl_log("NO INDEXED OUTPUT")
+		return
+	entries.reverse()
+
+	def output_index_panel_callback(index):
+		if index == -1:
+			return
+		callback(entries[index])
+
+	display_data = [
+		[e.command_string, "[{0}] {1} lines".format(e.execution_id, e.line_count(console))]
+		for e in entries
+	]
+	window.show_quick_panel(display_data, output_index_panel_callback)
+
+class SubliminolJumpToOutputCommand(sublime_plugin.WindowCommand):
+	'''
+	Jump to the console output of a past execution.
+	'''
+	def run(self):
+		def jump(entry):
+			_window, console = find_console(CONSOLE_NAME)
+			if console is not None:
+				OutputIndex.get(console).sync(console)
+				show_output_regions(CONSOLE_NAME, entry.regions())
+		run_output_index_panel(self.window, jump)
+
+class SubliminolSearchOutputCommand(sublime_plugin.WindowCommand):
+	'''
+	Search for text within the console output of a single past execution.
+	'''
+	def run(self):
+		run_output_index_panel(self.window, self.prompt_search)
+
+	def prompt_search(self, entry):
+		def on_done(pattern):
+			self.show_results(entry, pattern)
+		self.window.show_input_panel(
+			"Search [{0}]:".format(entry.execution_id), "", on_done, None, None
+		)
+
+	def show_results(self, entry, pattern):
+		_window, console = find_console(CONSOLE_NAME)
+		if console is None:
+			return
+		results = OutputIndex.get(console).search(console, entry.execution_id, pattern)
+		if not len(results):
+			sbnl_log("NO MATCHES: {0}".format(pattern))
+			return
+
+		def search_panel_callback(index):
+			if index == -1:
+				return
+			show_output_regions(CONSOLE_NAME, [results[index][1]])
+
+		display_data = [
+			"{0}: {1}".format(line_number, console.substr(region).strip())
+			for line_number, region in results
+		]
+		self.window.show_quick_panel(display_data, search_panel_callback)
+
+################################################################################
+################################################################################
+
 def get_history_key(command_mode):
 	return("{0}_history".format(command_mode))
 
@@ -280,8 +603,10 @@ class SubliminolCommand(sublime_plugin.TextCommand):
 		self.view.window().show_quick_panel( history_display_data, history_panel_callback)
 
 	def new_execution_id(self):
-		self.last_execution_id += 1
-		return self.last_execution_id 
+		# Incremented on the class so ids stay unique across views; they are
+		# used as keys by both _tasks and the console OutputIndex.
+		SubliminolCommand.last_execution_id += 1
+		return SubliminolCommand.last_execution_id
 
 	def get_command_regions(self, view=None):
 		sbnl_log("get_command_regions", level=3)
@@ -624,7 +949,13 @@ class SubliminolCallBase(Thread):
 		self._write_count += len(_output)
 		# self.console.set_read_only(False)
 		
+		output_index = OutputIndex.get(self.console)
+		output_index.sync(self.console)
 		self.console.insert(edit, insertion_point, _output)
+		output_index.record(
+			self.console, self.execution_id, self.command_string_data,
+			insertion_point, _output, payload_start=len(_output)-len("".join(output))
+		)
 		
 		# self.console.add_regions(self.get_target_region_id(), self.console.get_regions(self.get_target_region_id()), icon="Packages/Theme - Default/dot.png")
 
@@ -1,21 +1,39 @@
 import sys
+import os
+import stat
+import time
+import hashlib
+import argparse
 import zipfile
 
 SUBLIMINOL_SOURCE_FILES = ["Subliminol.py", "Subliminol (Windows).sublime-keymap", "Subliminol.sublime-settings"]
 SUBLIMINOL_DATA_FILES = ["Batch File.tmLanguage", "Neon.tmTheme"]
 
+# Fixed timestamp (the zip format epoch) so identical inputs produce identical packages.
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+ZIP_FILE_MODE = (stat.S_IFREG | 0o644) << 16
+HASH_SUFFIX = ".hash"
+
+
+class BuildTimer:
+	'''
+	Collects elapsed time per build step so the summary shows where time goes.
+	'''
+	def __init__(self):
+		self._steps = []
+		self._start = time.perf_counter()
+
+	def step(self, name, start):
+		self._steps.append((name, time.perf_counter() - start))
+
+	def report(self):
+		print("Timing:")
+		lmax = max([len(name) for name, elapsed in self._steps] + [5])
+		fmt_str = "     {0:<" + str(lmax+5) + "}{1:8.2f} ms"
+		for name, elapsed in self._steps:
+			print(fmt_str.format(name, elapsed * 1000))
+		print(fmt_str.format("total", (time.perf_counter() - self._start) * 1000))
 
-def write_package(package_filepath, file_map):
-	print("Writing to package:")
-	lmax = 0
-	for key, value in file_map.items():
-		if len(value) > lmax: lmax = len(value)
-	fmt_str = "     ADD: {0:<" + str(lmax+5) + "}({1})"
-	with zipfile.ZipFile(package_filepath, "w") as out_zip:
-		
-		for file, archive_path in file_map.iteritems():
-			print(fmt_str.format(archive_path, file))
-			out_zip.write(file, archive_path)
 
 def gather_files(project_dir):
 	print("Gathering files:")
@@ -26,17 +44,111 @@ def gather_files(project_dir):
 		file_map["{0}/data/{1}".format(project_dir, dat)] = dat
 	return file_map
 
-def do_build():
-	print "STARTING SUBLIMINOL BUILD"
-	file_map = gather_files(sys.argv[1].replace("\\", "/"))
-	output_file = sys.argv[2].replace("\\", "/")
-	print("   file_map:".format(file_map))
-	for k, v in file_map.items():
+def read_files(file_map):
+	'''
+	Return a list of (archive_path, bytes) sorted by archive path.
+	'''
+	contents = []
+	for file, archive_path in file_map.items():
+		with open(file, "rb") as in_file:
+			contents.append((archive_path, in_file.read()))
+	contents.sort()
+	return contents
+
+def hash_inputs(contents, options):
+	'''
+	Hash archive paths, file contents and build options into a single digest.
+	'''
+	digest = hashlib.sha256()
+	digest.update(repr(options).encode())
+	for archive_path, data in contents:
+		digest.update(archive_path.encode())
+		digest.update(b"\0")
+		digest.update(hashlib.sha256(data).digest())
+	return digest.hexdigest()
+
+def hash_build_script():
+	'''
+	The build script is part of the hashed inputs, so changes to packaging
+	behaviour invalidate previous builds.
+	'''
+	with open(__file__, "rb") as in_file:
+		return hashlib.sha256(in_file.read()).hexdigest()
+
+def is_up_to_date(package_filepath, input_hash):
+	if not os.path.isfile(package_filepath):
+		return False
+	try:
+		with open(package_filepath + HASH_SUFFIX, "r") as hash_file:
+			return hash_file.read().strip() == input_hash
+	except IOError:
+		return False
+
+def write_hash(package_filepath, input_hash):
+	with open(package_filepath + HASH_SUFFIX, "w") as hash_file:
+		hash_file.write(input_hash + "\n")
+
+def write_package(package_filepath, contents):
+	'''
+	Write a reproducible zip: sorted entries, fixed timestamps and permissions.
+	'''
+	print("Writing to package:")
+	for archive_path, data in contents:
+		print("     ADD: {0}".format(archive_path))
+	temp_filepath = package_filepath + ".tmp"
+	try:
+		with zipfile.ZipFile(temp_filepath, "w") as out_zip:
+			for archive_path, data in contents:
+				info = zipfile.ZipInfo(archive_path, date_time=ZIP_DATE_TIME)
+				info.compress_type = zipfile.ZIP_DEFLATED
+				# create_system 3 (Unix) so extractors honour the mode bits
+				info.create_system = 3
+				info.external_attr = ZIP_FILE_MODE
+				out_zip.writestr(info, data)
+		os.replace(temp_filepath, package_filepath)
+	except Exception:
+		if os.path.exists(temp_filepath):
+			os.remove(temp_filepath)
+		raise
+
+def parse_args(argv):
+	parser = argparse.ArgumentParser(description="Build the Subliminol sublime-package.")
+	parser.add_argument("project_dir", help="Subliminol source directory")
+	parser.add_argument("output_file", help="Path of the .sublime-package to write")
+	parser.add_argument("--force", action="store_true", help="Build even if inputs are unchanged")
+	return parser.parse_args(argv)
+
+def do_build(argv):
+	print("STARTING SUBLIMINOL BUILD")
+	args = parse_args(argv)
+	timer = BuildTimer()
+
+	start = time.perf_counter()
+	file_map = gather_files(args.project_dir.replace("\\", "/"))
+	output_file = args.output_file.replace("\\", "/")
+	for k, v in sorted(file_map.items()):
 		print("     {0}:     {1}".format(k, v))
 	print("   output_file:\n          {}".format(output_file))
+	contents = read_files(file_map)
+	timer.step("gather", start)
+
+	start = time.perf_counter()
+	options = {"build_script": hash_build_script()}
+	input_hash = hash_inputs(contents, options)
+	timer.step("hash", start)
+
+	if not args.force and is_up_to_date(output_file, input_hash):
+		print("SUBLIMINOL BUILD SKIPPED:\n\t{0} is up to date ({1})".format(output_file, input_hash[:12]))
+		timer.report()
+		return
+
+	start = time.perf_counter()
+	write_package(output_file, contents)
+	write_hash(output_file, input_hash)
+	timer.step("write", start)
 
-	# print("SUBLIMINOL BUILD - WRITING: {0}".format(output_file))
-	write_package(output_file, file_map)
-	print("SUBLIMINOL BUILD COMPLETE:\n\twrote {0}".format(output_file))
+	print("SUBLIMINOL BUILD COMPLETE:\n\twrote {0} ({1})".format(output_file, input_hash[:12]))
+	timer.report()
 
-do_build()
\ No newline at end of file
+if __name__ == "__main__":
+	do_build(sys.argv[1:])